@@ -1,13 +1,28 @@
+import atexit
+import io
+import json
 import os
+import random
 import re
+import socket
+import struct
 import subprocess
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from xml.sax.saxutils import escape
+from lxml import etree
 from pptx import Presentation
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
 from pptx.util import Pt, Inches
 from pptx.enum.text import PP_ALIGN
-from docx import Document
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.errors import HttpError
 
 # -------- CONFIG --------
 SERVICE_ACCOUNT_FILE = 'credentials.json'
@@ -22,33 +37,194 @@ DEFAULT_SONG_ORDER = [
     "See What a Morning (Resurrection Hymn)"
 ]
 
+# Metadata lines (section labels, hymnal numbers) that never belong in the bulletin
+_SKIP_RE = re.compile(r'(?:Hymnal #\d+|Verse \d+|Chorus)\b')
+
+# WordprocessingML namespace, pre-expanded for direct lxml traversal
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# Layout constants, built once instead of per call
+_MIDPOINT_EMU = int(Inches(5))
+_BOX_TOP = Inches(0.5)
+_BOX_WIDTH = Inches(4.5)
+_BOX_HEIGHT = Inches(5.7)
+_SIDE_LEFT = {'left': Inches(0.5), 'right': Inches(5.2)}
+
 # -------- GOOGLE SETUP --------
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 creds = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-drive_service = build('drive', 'v3', credentials=creds)
+drive_service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+
+# httplib2 is not thread-safe, so each worker thread gets its own service object
+_thread_local = threading.local()
+
+def get_drive_service():
+    service = getattr(_thread_local, "service", None)
+    if service is None:
+        service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        _thread_local.service = service
+    return service
+
+def get_authed_session():
+    """Per-thread AuthorizedSession: pooled keep-alive connections for media GETs."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = AuthorizedSession(creds)
+        _thread_local.session = session
+    return session
 
 # -------- HELPERS --------
 def find_file_id(name, parent_id=None):
     query = f"name = '{name}'"
     if parent_id:
         query += f" and '{parent_id}' in parents"
-    results = drive_service.files().list(q=query, fields="files(id, name)").execute()
+    try:
+        results = get_drive_service().files().list(q=query, fields="files(id, name)").execute(num_retries=5)
+    except HttpError as e:
+        print(f"[ERROR] Drive query failed for {name}: {e}")
+        return None
     return results.get("files", [])[0]["id"] if results.get("files") else None
 
-def download_file(file_id, local_path):
-    request = drive_service.files().get_media(fileId=file_id)
-    with open(local_path, "wb") as f:
-        downloader = MediaIoBaseDownload(f, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-    return local_path
+FOLDER_CACHE_PATH = ".bulletin_cache.json"
+
+def get_lyrics_folder_id(refresh=False):
+    """The folder id never changes, so resolve it once and keep it on disk."""
+    if not refresh:
+        try:
+            with open(FOLDER_CACHE_PATH) as f:
+                folder_id = json.load(f).get("lyrics_folder_id")
+            if folder_id:
+                return folder_id
+        except (OSError, ValueError):
+            pass
+    folder_id = find_file_id(LYRICS_FOLDER_NAME)
+    if folder_id:
+        with open(FOLDER_CACHE_PATH, "w") as f:
+            json.dump({"lyrics_folder_id": folder_id}, f)
+    return folder_id
+
+def list_folder_files(folder_id):
+    """List the whole lyrics folder once, returning lowercased name -> file metadata."""
+    file_index = {}
+    page_token = None
+    while True:
+        results = get_drive_service().files().list(
+            q=f"'{folder_id}' in parents and trashed=false",
+            fields="nextPageToken, files(id, name, mimeType, md5Checksum, modifiedTime, size)",
+            pageSize=1000,
+            pageToken=page_token).execute(num_retries=5)
+        for f in results.get("files", []):
+            file_index[f["name"].lower()] = f
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+    return file_index
+
+# -------- LYRIC CACHE --------
+CACHE_DIR = ".lyric_cache"
+CACHE_INDEX_PATH = os.path.join(CACHE_DIR, "cache_index.json")
+_cache_lock = threading.Lock()
+
+def _load_cache_index():
+    try:
+        with open(CACHE_INDEX_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+_cache_index = _load_cache_index()
+
+def _save_cache_index():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(CACHE_INDEX_PATH, "w") as f:
+        json.dump(_cache_index, f)
+
+def download_file(file_id, local_path, md5=None):
+    """Download into memory; returns (cache_path, data). data is None on a cache hit."""
+    cache_path = os.path.join(CACHE_DIR, local_path)
+    with _cache_lock:
+        cached = _cache_index.get(file_id)
+        if cached and md5 and cached.get("md5") == md5 and os.path.exists(cached["path"]):
+            print(f"[CACHE] Reusing {cached['path']}")
+            return cached["path"], None
+    session = get_authed_session()
+    url = f"https://www.googleapis.com/drive/v3/files/{file_id}"
+    for attempt in range(5):
+        resp = session.get(url, params={"alt": "media"}, stream=True)
+        if resp.status_code in (429, 500, 502, 503, 504):
+            resp.close()
+            time.sleep(min(64, 2 ** attempt + random.random()))
+            continue
+        resp.raise_for_status()
+        break
+    else:
+        resp.raise_for_status()
+    # 1 MiB reads: lyric docs arrive in one chunk, big files stay bounded
+    data = b"".join(resp.iter_content(chunk_size=1024 * 1024))
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(cache_path, "wb") as f:
+        f.write(data)
+    # A changed source invalidates any converted .docx sitting next to it
+    if os.path.exists(cache_path + "x"):
+        os.remove(cache_path + "x")
+    with _cache_lock:
+        _cache_index[file_id] = {"md5": md5, "path": cache_path}
+        _save_cache_index()
+    return cache_path, data
+
+# -------- LIBREOFFICE --------
+SOFFICE_PATH = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
+UNO_PORT = 2002
+_unoserver_process = None
+_unoserver_lock = threading.Lock()
+
+def _stop_unoserver():
+    if _unoserver_process is not None and _unoserver_process.poll() is None:
+        _unoserver_process.terminate()
+
+def _ensure_unoserver():
+    """Start one persistent unoserver so conversions skip the LibreOffice cold-start."""
+    global _unoserver_process
+    with _unoserver_lock:
+        if _unoserver_process is not None and _unoserver_process.poll() is None:
+            return True
+        try:
+            _unoserver_process = subprocess.Popen(
+                ["unoserver", "--port", str(UNO_PORT), "--user-installation", "/tmp/lo_bulletin"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            print("[DEBUG] unoserver not installed, falling back to one-shot soffice")
+            _unoserver_process = None
+            return False
+        atexit.register(_stop_unoserver)
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", UNO_PORT), timeout=0.5).close()
+                return True
+            except OSError:
+                time.sleep(0.25)
+        print("[ERROR] unoserver did not come up in time, falling back to one-shot soffice")
+        return False
 
 def convert_doc_to_docx(doc_path):
     output_path = doc_path + "x"
-    soffice_path = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
+    if _ensure_unoserver():
+        try:
+            subprocess.run(["unoconvert", "--port", str(UNO_PORT), "--convert-to", "docx", doc_path, output_path],
+                           check=True, capture_output=True, text=True)
+            return output_path if os.path.exists(output_path) else None
+        except subprocess.CalledProcessError as e:
+            print(f"[ERROR] unoconvert failed for {doc_path}. Error: {e.stderr}")
+            return None
     try:
-        result = subprocess.run([soffice_path, "--headless", "--convert-to", "docx", "--outdir", ".", doc_path],
+        # Unique profile dir per invocation: concurrent soffice processes would
+        # otherwise collide on the shared user-profile lock and serialize
+        profile_dir = tempfile.mkdtemp(prefix="lo_bulletin_")
+        result = subprocess.run([SOFFICE_PATH, "--headless",
+                                 f"-env:UserInstallation=file://{profile_dir}",
+                                 "--convert-to", "docx",
+                                 "--outdir", os.path.dirname(doc_path) or ".", doc_path],
                                 check=True, capture_output=True, text=True)
         print(f"[DEBUG] Conversion stdout: {result.stdout.strip()}")
         print(f"[DEBUG] Conversion stderr: {result.stderr.strip()}")
@@ -57,72 +233,137 @@ def convert_doc_to_docx(doc_path):
         print(f"[ERROR] Conversion failed for {doc_path}. Command: {' '.join(e.cmd)}. Output: {e.output}. Error: {e.stderr}")
         return None
     except FileNotFoundError:
-        print(f"[ERROR] LibreOffice (soffice) not found at {soffice_path}. Please ensure LibreOffice is installed and the path is correct.")
+        print(f"[ERROR] LibreOffice (soffice) not found at {SOFFICE_PATH}. Please ensure LibreOffice is installed and the path is correct.")
         return None
 
-def extract_text_and_style(docx_path):
+def extract_doc_lines(doc_path):
+    """Pull the text stream straight out of a legacy binary .doc, no LibreOffice.
+
+    Returns (text, italic) tuples like the .docx path, or None when the file
+    needs the conversion fallback (olefile missing, complex/incremental save,
+    or anything unexpected in the FIB). Italic runs are not recovered from the
+    binary format, so lines come back non-italic.
+    """
     try:
-        doc = Document(docx_path)
+        import olefile
+    except ImportError:
+        return None
+    try:
+        with olefile.OleFileIO(doc_path) as ole:
+            word_stream = ole.openstream("WordDocument").read()
+        flags = struct.unpack_from("<H", word_stream, 10)[0]
+        if flags & 0x0004:  # fComplex: piece table in use, text is not contiguous
+            return None
+        fc_min, fc_mac = struct.unpack_from("<II", word_stream, 24)
+        encoding = "utf-16-le" if flags & 0x1000 else "cp1252"
+        text = word_stream[fc_min:fc_mac].decode(encoding, errors="ignore")
         lines = []
-        for p in doc.paragraphs:
+        for line in text.replace("\x07", "\r").split("\r"):
+            line = "".join(ch for ch in line if ch.isprintable()).strip()
+            if line and not _SKIP_RE.match(line):
+                lines.append((line, False))
+        return lines or None
+    except Exception as e:
+        print(f"[DEBUG] Direct .doc parse failed for {doc_path}: {e}")
+        return None
+
+def extract_text_and_style(source):
+    """Parse lyrics from a .docx path, raw .docx bytes, or a legacy .doc path."""
+    if isinstance(source, str) and source.lower().endswith(".doc"):
+        lines = extract_doc_lines(source)
+        if lines is not None:
+            return lines
+        # Cached conversion: the converted file lives next to its source in the
+        # cache dir and is invalidated by download_file when the source changes.
+        converted = source + "x"
+        if not os.path.exists(converted):
+            converted = convert_doc_to_docx(source)
+            if not converted:
+                return []
+        return extract_text_and_style(converted)
+    try:
+        # Read word/document.xml straight out of the zip — one lxml traversal
+        # instead of python-docx's proxy objects per paragraph/run
+        with zipfile.ZipFile(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as z:
+            root = etree.fromstring(z.read('word/document.xml'))
+        lines = []
+        for p in root.iter(_W + 'p'):
             paragraph_text = []
             current_italic = False
-            for run in p.runs:
-                text = run.text
+            for r in p.iter(_W + 'r'):
+                text = "".join(t.text for t in r.iter(_W + 't') if t.text)
                 if text:
                     paragraph_text.append(text)
-                    current_italic = current_italic or run.italic
+                    if not current_italic:
+                        i_el = r.find(f'{_W}rPr/{_W}i')
+                        if i_el is not None and i_el.get(_W + 'val') not in ('0', 'false'):
+                            current_italic = True
             if paragraph_text:
-                full_text = "".join(paragraph_text).rstrip()
-                if full_text.strip():
-                    if not (re.match(r'Hymnal #\d+', full_text) or
-                            re.match(r'Verse \d+', full_text) or
-                            re.match(r'Chorus', full_text)):
-                        lines.append((full_text.strip(), current_italic))
+                full_text = "".join(paragraph_text).strip()
+                if full_text and not _SKIP_RE.match(full_text):
+                    lines.append((full_text, current_italic))
         return lines
     except Exception as e:
-        print(f"[ERROR] Failed to extract text from {docx_path}: {e}")
+        print(f"[ERROR] Failed to extract text from {source if isinstance(source, str) else 'downloaded bytes'}: {e}")
         return []
 
-def clear_side(slide, side, slide_index):
-    midpoint = Inches(5)
-    shapes_to_remove = [shape for shape in slide.shapes if hasattr(shape, "left") and ((side == 'left' and shape.left.inches < midpoint) or (side == 'right' and shape.left.inches >= midpoint))]
-    for shape in shapes_to_remove:
-        slide.shapes._spTree.remove(shape._element)
-    print(f"[DEBUG] Cleared {len(shapes_to_remove)} shapes on slide {slide_index + 1} ({side})")
+def partition_and_clear(slide, sides, slide_index):
+    """Remove the shapes on the requested sides in one pass over the shape tree."""
+    sp_tree = slide.shapes._spTree
+    removed = 0
+    for shape in list(slide.shapes):
+        try:
+            left = shape.left  # raw EMU int; .inches would allocate a float per shape
+        except AttributeError:
+            continue
+        side = 'left' if left < _MIDPOINT_EMU else 'right'
+        if side in sides:
+            sp_tree.remove(shape._element)
+            removed += 1
+    print(f"[DEBUG] Cleared {removed} shapes on slide {slide_index + 1} ({', '.join(sorted(sides))})")
+
+def _run_xml(text, size, italic=False, bold=False, font="Montserrat"):
+    """One <a:r> as an XML string; size is in hundredths of a point."""
+    attrs = f' sz="{size}"'
+    if bold:
+        attrs += ' b="1"'
+    if italic:
+        attrs += ' i="1"'
+    return (f'<a:r><a:rPr lang="en-US"{attrs}><a:latin typeface="{font}"/></a:rPr>'
+            f'<a:t>{escape(text)}</a:t></a:r>')
+
+def _paragraph_xml(runs_xml, space_before=None, space_after=None):
+    """One left-aligned <a:p> wrapping pre-built run XML; spacing in points."""
+    spacing = ''
+    if space_before is not None:
+        spacing += f'<a:spcBef><a:spcPts val="{space_before * 100}"/></a:spcBef>'
+    if space_after is not None:
+        spacing += f'<a:spcAft><a:spcPts val="{space_after * 100}"/></a:spcAft>'
+    return f'<a:p><a:pPr algn="l">{spacing}</a:pPr>{runs_xml}</a:p>'
+
+def _append_paragraphs(text_frame, paragraphs_xml):
+    """Parse all paragraphs in one go and bulk-append them to the text frame."""
+    fragment = parse_xml(f'<root {nsdecls("a")}>{"".join(paragraphs_xml)}</root>')
+    text_frame._txBody.extend(list(fragment))
 
 def add_song_content(slide, side, title, lines, slide_index):
-    if side == 'left':
-        left, width = Inches(0.5), Inches(4.5)
-        top = Inches(0.5) # Default top
-    elif side == 'right':
-        left, width = Inches(5.2), Inches(4.5)
-        top = Inches(0.5) # Changed from 0.7 to 0.5 to align with left side
-
-    # Remove special offset for Slide 3 (right) since top is now consistent
-    # if slide_index == 2 and side == 'right': # Slide 3 is 0-indexed as 2
-    #     top = Inches(0.7) # Nudge it down slightly
-    #     print(f"[DEBUG] Applying special top offset for Slide {slide_index + 1} ({side}) content box.")
+    left = _SIDE_LEFT[side]
+    width = _BOX_WIDTH
+    top = _BOX_TOP
 
-    clear_side(slide, side, slide_index)
-
-    content_box = slide.shapes.add_textbox(left, top, width, Inches(5.7))
+    content_box = slide.shapes.add_textbox(left, top, width, _BOX_HEIGHT)
     tf_content = content_box.text_frame
     tf_content.word_wrap = True
     print(f"[DEBUG] Created textbox at left={left.inches}, top={top.inches}, width={width.inches}, height=5.7 for slide {slide_index + 1} ({side})")
 
-    p_title = tf_content.add_paragraph()
-    run_title = p_title.add_run()
-    run_title.text = title
-    run_title.font.size = Pt(11)
-    run_title.font.name = "Montserrat"
-    run_title.font.bold = True
-    p_title.alignment = PP_ALIGN.LEFT
+    # Assemble the whole body as XML strings and parse once — per-line
+    # add_paragraph()/add_run()/font setters are ~6 lxml mutations per line
+    paragraphs = [_paragraph_xml(_run_xml(title, 1100, bold=True))]
 
+    last_line_info = None
     if lines:
         lines_for_content = lines[1:] if len(lines) > 1 and lines[0][0].strip().lower() == title.strip().lower() else lines
 
-        last_line_info = None
         if lines_for_content:
             potential_last_line_text = lines_for_content[-1][0].strip()
             if any(char.isdigit() for char in potential_last_line_text) and (
@@ -143,107 +384,132 @@ def add_song_content(slide, side, title, lines, slide_index):
                 should_break_verse = True
 
             if should_break_verse:
-                p_lyrics = tf_content.add_paragraph()
-                p_lyrics.alignment = PP_ALIGN.LEFT
-                p_lyrics.space_before = Pt(0)
-                p_lyrics.space_after = Pt(0)
-
+                runs = []
                 for k, (line_text, line_italic) in enumerate(current_verse):
-                    run_lyrics = p_lyrics.add_run()
-                    run_lyrics.text = line_text
-                    run_lyrics.font.size = Pt(11)
-                    run_lyrics.font.name = "Montserrat"
-                    run_lyrics.font.italic = line_italic
+                    runs.append(_run_xml(line_text, 1100, italic=line_italic))
                     if k < len(current_verse) - 1:
-                        run_lyrics.text += '\n'
+                        runs.append('<a:br/>')
+                paragraphs.append(_paragraph_xml(''.join(runs), space_before=0, space_after=0))
 
                 if (text.strip().endswith('!') and len(text.strip()) > 0) or \
                    (len(text.split()) <= 2 and not text.strip().endswith(':') and not text.strip().endswith(';')):
                     if i < len(lines_for_content) - 1 or not last_line_info:
-                        p_lyrics_space = tf_content.add_paragraph()
-                        p_lyrics_space.space_before = Pt(12)
-                        p_lyrics_space.space_after = Pt(0)
+                        paragraphs.append(_paragraph_xml('', space_before=12, space_after=0))
                 current_verse = []
 
     if last_line_info:
-        p_ref = tf_content.add_paragraph()
-        run_ref = p_ref.add_run()
-        run_ref.text = last_line_info[0]
-        run_ref.font.size = Pt(5)
-        run_ref.font.name = "Montserrat"
-        run_ref.font.italic = last_line_info[1]
-        p_ref.alignment = PP_ALIGN.LEFT
-        p_ref.space_before = Pt(12)
-        p_ref.space_after = Pt(0)
+        paragraphs.append(_paragraph_xml(
+            _run_xml(last_line_info[0], 500, italic=last_line_info[1]),
+            space_before=12, space_after=0))
+
+    _append_paragraphs(tf_content, paragraphs)
 
     print(f"[SUCCESS] Added {title} to slide {slide_index + 1} ({side})")
 
 
+def fetch_song(entry, song_order, file_index):
+    """Network + conversion only — no pptx mutation (python-pptx is not thread-safe)."""
+    song_name = song_order[entry['song_index']]
+    source = None
+
+    meta = file_index.get(f"{song_name}.docx".lower())
+    if meta:
+        local_path, data = download_file(meta["id"], f"{song_name}.docx", md5=meta.get("md5Checksum"))
+        source = data or local_path
+    else:
+        meta = file_index.get(f"{song_name}.doc".lower())
+        if meta:
+            # .doc stays path-based: the conversion fallback needs a file on disk
+            source, _ = download_file(meta["id"], f"{song_name}.doc", md5=meta.get("md5Checksum"))
+            # Pre-warm the conversion here so it overlaps with other downloads;
+            # extract_text_and_style will find the converted sibling already cached
+            if source and extract_doc_lines(source) is None and not os.path.exists(source + "x"):
+                convert_doc_to_docx(source)
+    return entry, song_name, source
+
+
 def generate_bulletin(song_order):
     prs = Presentation(TEMPLATE_PPTX)
-    lyrics_folder_id = find_file_id(LYRICS_FOLDER_NAME)
+    lyrics_folder_id = get_lyrics_folder_id()
     if not lyrics_folder_id:
         print("[ERROR] Lyrics folder not found")
         return
 
-    SONG_SLIDE_MAP = [
-        {'slide_index': 3, 'side': 'left', 'song_index': 1},    # A Mighty Fortress is Our God
-        {'slide_index': 3, 'side': 'right', 'song_index': 2},   # Christ the Lord is Risen Today
-        {'slide_index': 2, 'side': 'left', 'song_index': 3},    # Christ Arose
-        {'slide_index': 1, 'side': 'right', 'song_index': 4},   # See What a Morning (Resurrection Hymn)
-        {'slide_index': 2, 'side': 'right', 'song_index': 0}    # Because He Lives
+    # song position in the entered order -> (slide_index, side)
+    SONG_PLACEMENT = {
+        1: (3, 'left'),    # A Mighty Fortress is Our God
+        2: (3, 'right'),   # Christ the Lord is Risen Today
+        3: (2, 'left'),    # Christ Arose
+        4: (1, 'right'),   # See What a Morning (Resurrection Hymn)
+        0: (2, 'right'),   # Because He Lives
+    }
+
+    # Fail fast on short song lists: report every unfillable placement up
+    # front so no Drive call is made on its behalf.
+    missing = {i for i in SONG_PLACEMENT if i >= len(song_order)}
+    for song_index in sorted(missing):
+        slide_index, side = SONG_PLACEMENT[song_index]
+        print(f"[WARN] No song at position {song_index + 1}; slide {slide_index + 1} ({side}) will keep its template content")
+
+    entries = [
+        {'slide_index': placement[0], 'side': placement[1], 'song_index': song_index}
+        for song_index, placement in SONG_PLACEMENT.items()
+        if song_index not in missing
     ]
 
-    temp_files = []
-    for entry in SONG_SLIDE_MAP:
+    try:
+        file_index = list_folder_files(lyrics_folder_id)
+    except HttpError as e:
+        if e.resp.status != 404:
+            raise
+        # The cached folder id went stale; re-resolve once and retry
+        lyrics_folder_id = get_lyrics_folder_id(refresh=True)
+        if not lyrics_folder_id:
+            print("[ERROR] Lyrics folder not found")
+            return
+        file_index = list_folder_files(lyrics_folder_id)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(fetch_song, entry, song_order, file_index) for entry in entries]
+        for future in as_completed(futures):
+            results.append(future.result())
+
+    # All pptx mutation happens on the main thread
+    placements = []
+    for entry, song_name, source in results:
         try:
-            slide = prs.slides[entry['slide_index']]
+            prs.slides[entry['slide_index']]
             print(f"[DEBUG] Processing slide {entry['slide_index'] + 1} ({entry['side']}) with song_index {entry['song_index']}")
         except IndexError:
             print(f"[ERROR] Slide index {entry['slide_index']} is out of range. Check your template.")
             continue
 
         side = entry['side']
-        song_index = entry['song_index']
-        if song_index >= len(song_order):
-            continue
-        song_name = song_order[song_index]
         print(f"[PROCESSING] Slide {entry['slide_index'] + 1} ({side}) → {song_name}")
 
-        file_id = find_file_id(song_name + ".docx", parent_id=lyrics_folder_id)
-        local_path = None
-        if file_id:
-            local_path = download_file(file_id, f"{song_name}.docx")
-            temp_files.append(local_path)
-        else:
-            file_id = find_file_id(song_name + ".doc", parent_id=lyrics_folder_id)
-            if file_id:
-                doc_path = download_file(file_id, f"{song_name}.doc")
-                temp_files.append(doc_path)
-                local_path = convert_doc_to_docx(doc_path)
-                if local_path:
-                    temp_files.append(local_path)
-                else:
-                    temp_files.remove(doc_path)
-        if not local_path:
+        if source is None:
             print(f"[ERROR] No valid file for {song_name}")
             continue
 
-        lines = extract_text_and_style(local_path)
+        lines = extract_text_and_style(source)
         if not lines:
-            print(f"[DEBUG] No lines extracted for '{song_name}' from '{os.path.basename(local_path)}'. This could be why it's blank.")
-        else:
-            print(f"[DEBUG] Extracted lines for '{song_name}' from '{os.path.basename(local_path)}': {lines}")
-
-        if lines:
-            clear_side(slide, side, entry['slide_index'])
-            add_song_content(slide, side, song_name, lines, entry['slide_index'])
-        else:
+            print(f"[DEBUG] No lines extracted for '{song_name}'. This could be why it's blank.")
             print(f"[WARNING] No content to add for {song_name} on slide {entry['slide_index'] + 1} ({side})")
+            continue
+        print(f"[DEBUG] Extracted lines for '{song_name}': {lines}")
+        placements.append((entry, song_name, lines))
+
+    # Clear each touched slide in a single shape-tree walk, then insert
+    sides_by_slide = {}
+    for entry, _, _ in placements:
+        sides_by_slide.setdefault(entry['slide_index'], set()).add(entry['side'])
+    for slide_index, sides in sides_by_slide.items():
+        partition_and_clear(prs.slides[slide_index], sides, slide_index)
+
+    for entry, song_name, lines in placements:
+        add_song_content(prs.slides[entry['slide_index']], entry['side'], song_name, lines, entry['slide_index'])
 
-    for file in temp_files:
-        if os.path.exists(file):
-            os.remove(file)
     prs.save(OUTPUT_PPTX)
     print(f"\n✅ Updated bulletin saved as '{OUTPUT_PPTX}'")
 
@@ -1,14 +1,29 @@
+import atexit
+import io
+import json
 import os
+import random
 import re
+import socket
+import struct
 import subprocess
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from xml.sax.saxutils import escape
+from lxml import etree
 from pptx import Presentation
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
 from pptx.util import Pt, Inches
 from pptx.enum.text import PP_ALIGN
 from pptx.enum.text import MSO_ANCHOR
-from docx import Document
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+from googleapiclient.errors import HttpError
 
 # -------- CONFIG --------
 CONFIG = {
@@ -34,77 +49,304 @@ CONFIG = {
     ]
 }
 
+# Metadata lines (section labels, hymnal numbers) that never belong in the bulletin
+_SKIP_RE = re.compile(r'(?:Hymnal #\d+|Verse \d+|Chorus)\b')
+
+# WordprocessingML namespace, pre-expanded for direct lxml traversal
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# Layout constants, built once from CONFIG instead of per call
+_MIDPOINT_EMU = int(Inches(5))
+_BOX_TOP = Inches(CONFIG["BOX_TOP"])
+_BOX_WIDTH = Inches(CONFIG["BOX_WIDTH"])
+_BOX_HEIGHT = Inches(CONFIG["BOX_HEIGHT"])
+_SIDE_LEFT = {'left': Inches(CONFIG["LEFT_MARGIN"]), 'right': Inches(CONFIG["RIGHT_MARGIN"])}
+_TITLE_PT = Pt(CONFIG["TITLE_SIZE"])
+
 # -------- GOOGLE SETUP --------
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 creds = service_account.Credentials.from_service_account_file(CONFIG["SERVICE_ACCOUNT_FILE"], scopes=SCOPES)
-drive_service = build('drive', 'v3', credentials=creds)
+drive_service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+
+# httplib2 is not thread-safe, so each worker thread gets its own service object
+_thread_local = threading.local()
+
+def get_drive_service():
+    service = getattr(_thread_local, "service", None)
+    if service is None:
+        service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+        _thread_local.service = service
+    return service
+
+def get_authed_session():
+    """Per-thread AuthorizedSession: pooled keep-alive connections for media GETs."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = AuthorizedSession(creds)
+        _thread_local.session = session
+    return session
 
 # -------- HELPERS --------
 def find_file_id(name, parent_id=None):
     query = f"name = '{name}'"
     if parent_id:
         query += f" and '{parent_id}' in parents"
-    results = drive_service.files().list(q=query, fields="files(id, name)").execute()
+    try:
+        results = get_drive_service().files().list(q=query, fields="files(id, name)").execute(num_retries=5)
+    except HttpError as e:
+        print(f"[ERROR] Drive query failed for {name}: {e}")
+        return None
     return results.get("files", [])[0]["id"] if results.get("files") else None
 
-def download_file(file_id, local_path):
-    request = drive_service.files().get_media(fileId=file_id)
-    with open(local_path, "wb") as f:
-        downloader = MediaIoBaseDownload(f, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-    return local_path
+FOLDER_CACHE_PATH = ".bulletin_cache.json"
+
+def get_lyrics_folder_id(refresh=False):
+    """The folder id never changes, so resolve it once and keep it on disk."""
+    if not refresh:
+        try:
+            with open(FOLDER_CACHE_PATH) as f:
+                folder_id = json.load(f).get("lyrics_folder_id")
+            if folder_id:
+                return folder_id
+        except (OSError, ValueError):
+            pass
+    folder_id = find_file_id(CONFIG["LYRICS_FOLDER_NAME"])
+    if folder_id:
+        with open(FOLDER_CACHE_PATH, "w") as f:
+            json.dump({"lyrics_folder_id": folder_id}, f)
+    return folder_id
+
+def list_folder_files(folder_id):
+    """List the whole lyrics folder once, returning lowercased name -> file metadata."""
+    file_index = {}
+    page_token = None
+    while True:
+        results = get_drive_service().files().list(
+            q=f"'{folder_id}' in parents and trashed=false",
+            fields="nextPageToken, files(id, name, mimeType, md5Checksum, modifiedTime, size)",
+            pageSize=1000,
+            pageToken=page_token).execute(num_retries=5)
+        for f in results.get("files", []):
+            file_index[f["name"].lower()] = f
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+    return file_index
+
+CACHE_DIR = ".lyric_cache"
+CACHE_INDEX_PATH = os.path.join(CACHE_DIR, "cache_index.json")
+_cache_lock = threading.Lock()
+
+def _load_cache_index():
+    try:
+        with open(CACHE_INDEX_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+_cache_index = _load_cache_index()
+
+def _save_cache_index():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(CACHE_INDEX_PATH, "w") as f:
+        json.dump(_cache_index, f)
+
+def download_file(file_id, local_path, md5=None):
+    """Download into memory; returns (cache_path, data). data is None on a cache hit."""
+    cache_path = os.path.join(CACHE_DIR, local_path)
+    with _cache_lock:
+        cached = _cache_index.get(file_id)
+        if cached and md5 and cached.get("md5") == md5 and os.path.exists(cached["path"]):
+            print(f"[CACHE] Reusing {cached['path']}")
+            return cached["path"], None
+    session = get_authed_session()
+    url = f"https://www.googleapis.com/drive/v3/files/{file_id}"
+    for attempt in range(5):
+        resp = session.get(url, params={"alt": "media"}, stream=True)
+        if resp.status_code in (429, 500, 502, 503, 504):
+            resp.close()
+            time.sleep(min(64, 2 ** attempt + random.random()))
+            continue
+        resp.raise_for_status()
+        break
+    else:
+        resp.raise_for_status()
+    # 1 MiB reads: lyric docs arrive in one chunk, big files stay bounded
+    data = b"".join(resp.iter_content(chunk_size=1024 * 1024))
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(cache_path, "wb") as f:
+        f.write(data)
+    # A changed source invalidates any converted .docx sitting next to it
+    if os.path.exists(cache_path + "x"):
+        os.remove(cache_path + "x")
+    with _cache_lock:
+        _cache_index[file_id] = {"md5": md5, "path": cache_path}
+        _save_cache_index()
+    return cache_path, data
+
+SOFFICE_PATH = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
+UNO_PORT = 2002
+_unoserver_process = None
+_unoserver_lock = threading.Lock()
+
+def _stop_unoserver():
+    if _unoserver_process is not None and _unoserver_process.poll() is None:
+        _unoserver_process.terminate()
+
+def _ensure_unoserver():
+    """Start one persistent unoserver so conversions skip the LibreOffice cold-start."""
+    global _unoserver_process
+    with _unoserver_lock:
+        if _unoserver_process is not None and _unoserver_process.poll() is None:
+            return True
+        try:
+            _unoserver_process = subprocess.Popen(
+                ["unoserver", "--port", str(UNO_PORT), "--user-installation", "/tmp/lo_bulletin"],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            _unoserver_process = None
+            return False
+        atexit.register(_stop_unoserver)
+        deadline = time.monotonic() + 15
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", UNO_PORT), timeout=0.5).close()
+                return True
+            except OSError:
+                time.sleep(0.25)
+        return False
 
 def convert_doc_to_docx(doc_path):
     output_path = doc_path + "x"
-    soffice_path = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
+    if _ensure_unoserver():
+        try:
+            subprocess.run(["unoconvert", "--port", str(UNO_PORT), "--convert-to", "docx", doc_path, output_path],
+                           check=True, capture_output=True, text=True)
+            return output_path if os.path.exists(output_path) else None
+        except Exception:
+            return None
     try:
-        subprocess.run([soffice_path, "--headless", "--convert-to", "docx", "--outdir", ".", doc_path],
+        # Unique profile dir per invocation: concurrent soffice processes would
+        # otherwise collide on the shared user-profile lock and serialize
+        profile_dir = tempfile.mkdtemp(prefix="lo_bulletin_")
+        subprocess.run([SOFFICE_PATH, "--headless",
+                        f"-env:UserInstallation=file://{profile_dir}",
+                        "--convert-to", "docx",
+                        "--outdir", os.path.dirname(doc_path) or ".", doc_path],
                        check=True, capture_output=True, text=True)
         return output_path if os.path.exists(output_path) else None
     except Exception:
         return None
 
-def extract_text_and_style(docx_path):
+def extract_doc_lines(doc_path):
+    """Pull the text stream straight out of a legacy binary .doc, no LibreOffice.
+
+    Returns (text, italic) tuples like the .docx path, or None when the file
+    needs the conversion fallback. Italic runs are not recovered from the
+    binary format, so lines come back non-italic.
+    """
+    try:
+        import olefile
+    except ImportError:
+        return None
+    try:
+        with olefile.OleFileIO(doc_path) as ole:
+            word_stream = ole.openstream("WordDocument").read()
+        flags = struct.unpack_from("<H", word_stream, 10)[0]
+        if flags & 0x0004:  # fComplex: piece table in use, text is not contiguous
+            return None
+        fc_min, fc_mac = struct.unpack_from("<II", word_stream, 24)
+        encoding = "utf-16-le" if flags & 0x1000 else "cp1252"
+        text = word_stream[fc_min:fc_mac].decode(encoding, errors="ignore")
+        lines = []
+        for line in text.replace("\x07", "\r").split("\r"):
+            line = "".join(ch for ch in line if ch.isprintable()).strip()
+            if line and not _SKIP_RE.match(line):
+                lines.append((line, False))
+        return lines or None
+    except Exception:
+        return None
+
+def extract_text_and_style(source):
+    """Parse lyrics from a .docx path, raw .docx bytes, or a legacy .doc path."""
+    if isinstance(source, str) and source.lower().endswith(".doc"):
+        lines = extract_doc_lines(source)
+        if lines is not None:
+            return lines
+        # Cached conversion: the converted file lives next to its source in the
+        # cache dir and is invalidated by download_file when the source changes.
+        converted = source + "x"
+        if not os.path.exists(converted):
+            converted = convert_doc_to_docx(source)
+            if not converted:
+                return []
+        return extract_text_and_style(converted)
     try:
-        doc = Document(docx_path)
+        # Read word/document.xml straight out of the zip and walk it with lxml:
+        # one traversal collects text and italics with no python-docx proxies.
+        with zipfile.ZipFile(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as z:
+            root = etree.fromstring(z.read('word/document.xml'))
         lines = []
-        for p in doc.paragraphs:
+        for p in root.iter(_W + 'p'):
             paragraph_text = []
             current_italic = False
-            for run in p.runs:
-                if run.text:
-                    paragraph_text.append(run.text)
-                    current_italic = current_italic or run.italic
+            for r in p.iter(_W + 'r'):
+                text = "".join(t.text for t in r.iter(_W + 't') if t.text)
+                if text:
+                    paragraph_text.append(text)
+                    if not current_italic:
+                        i_el = r.find(f'{_W}rPr/{_W}i')
+                        if i_el is not None and i_el.get(_W + 'val') not in ('0', 'false'):
+                            current_italic = True
             if paragraph_text:
                 full_text = "".join(paragraph_text).strip()
-                if full_text and not re.match(r'(Hymnal #\d+|Verse \d+|Chorus)', full_text):
+                if full_text and not _SKIP_RE.match(full_text):
                     lines.append((full_text, current_italic))
         return lines
     except Exception:
         return []
 
-def clear_side(slide, side):
-    midpoint = Inches(5)
-    to_remove = []
-    for shape in slide.shapes:
-        if not hasattr(shape, "left"):
+def partition_and_clear(slide, sides):
+    """Remove the shapes on the requested sides in one pass over the shape tree."""
+    sp_tree = slide.shapes._spTree
+    removed = 0
+    for shape in list(slide.shapes):
+        try:
+            left = shape.left  # raw EMU int; .inches would allocate a float per shape
+        except AttributeError:
             continue
-        if (side == 'left' and shape.left < midpoint) or (side == 'right' and shape.left >= midpoint):
-            to_remove.append(shape)
-    for shape in to_remove:
-        slide.shapes._spTree.remove(shape._element)
-    print(f"[CLEAR] Removed {len(to_remove)} shapes from slide ({side})")
+        side = 'left' if left < _MIDPOINT_EMU else 'right'
+        if side in sides:
+            sp_tree.remove(shape._element)
+            removed += 1
+    print(f"[CLEAR] Removed {removed} shapes from slide ({', '.join(sorted(sides))})")
 
-def add_song_content(slide, side, title, lines):
-    top = Inches(CONFIG["BOX_TOP"])
-    width = Inches(CONFIG["BOX_WIDTH"])
-    height = Inches(CONFIG["BOX_HEIGHT"])
-    left = Inches(CONFIG["LEFT_MARGIN"] if side == 'left' else CONFIG["RIGHT_MARGIN"])
+def _run_xml(text, size, italic=False, bold=False, font=CONFIG["FONT_NAME"]):
+    """One <a:r> as an XML string; size is in hundredths of a point."""
+    attrs = f' sz="{size}"'
+    if bold:
+        attrs += ' b="1"'
+    if italic:
+        attrs += ' i="1"'
+    return (f'<a:r><a:rPr lang="en-US"{attrs}><a:latin typeface="{font}"/></a:rPr>'
+            f'<a:t>{escape(text)}</a:t></a:r>')
+
+def _paragraph_xml(runs_xml, space_before=None, space_after=None):
+    """One left-aligned <a:p> wrapping pre-built run XML; spacing in points."""
+    spacing = ''
+    if space_before is not None:
+        spacing += f'<a:spcBef><a:spcPts val="{space_before * 100}"/></a:spcBef>'
+    if space_after is not None:
+        spacing += f'<a:spcAft><a:spcPts val="{space_after * 100}"/></a:spcAft>'
+    return f'<a:p><a:pPr algn="l">{spacing}</a:pPr>{runs_xml}</a:p>'
+
+def _append_paragraphs(text_frame, paragraphs_xml):
+    """Parse all paragraphs in one go and bulk-append them to the text frame."""
+    fragment = parse_xml(f'<root {nsdecls("a")}>{"".join(paragraphs_xml)}</root>')
+    text_frame._txBody.extend(list(fragment))
 
-    clear_side(slide, side)
-    box = slide.shapes.add_textbox(left, top, width, height)
+def add_song_content(slide, side, title, lines):
+    box = slide.shapes.add_textbox(_SIDE_LEFT[side], _BOX_TOP, _BOX_WIDTH, _BOX_HEIGHT)
     tf = box.text_frame
     tf.word_wrap = True
     tf.vertical_anchor = MSO_ANCHOR.TOP
@@ -113,7 +355,7 @@ def add_song_content(slide, side, title, lines):
     p_title = tf.paragraphs[0]
     run_title = p_title.add_run()
     run_title.text = title
-    run_title.font.size = Pt(CONFIG["TITLE_SIZE"])
+    run_title.font.size = _TITLE_PT
     run_title.font.name = CONFIG["FONT_NAME"]
     run_title.font.bold = True
     p_title.alignment = PP_ALIGN.LEFT
@@ -123,75 +365,109 @@ def add_song_content(slide, side, title, lines):
     if last_line_info:
         lines = lines[:-1]
 
-    for (text, is_italic) in lines:
-        p = tf.add_paragraph()
-        p.alignment = PP_ALIGN.LEFT
-        run = p.add_run()
-        run.text = text
-        run.font.size = Pt(CONFIG["FONT_SIZE"])
-        run.font.name = CONFIG["FONT_NAME"]
-        run.font.italic = is_italic
+    # Assemble the whole body as XML strings and parse once — per-line
+    # add_paragraph()/add_run()/font setters are ~6 lxml mutations per line
+    body_size = CONFIG["FONT_SIZE"] * 100
+    paragraphs = [_paragraph_xml(_run_xml(text, body_size, italic=is_italic))
+                  for (text, is_italic) in lines]
 
     if last_line_info:
-        p_ref = tf.add_paragraph()
-        run_ref = p_ref.add_run()
-        run_ref.text = last_line_info[0]
-        run_ref.font.size = Pt(CONFIG["FOOTNOTE_SIZE"])
-        run_ref.font.name = CONFIG["FONT_NAME"]
-        run_ref.font.italic = last_line_info[1]
-        p_ref.alignment = PP_ALIGN.LEFT
-        p_ref.space_before = Pt(12)
-        p_ref.space_after = Pt(0)
+        paragraphs.append(_paragraph_xml(
+            _run_xml(last_line_info[0], CONFIG["FOOTNOTE_SIZE"] * 100, italic=last_line_info[1]),
+            space_before=12, space_after=0))
+
+    if paragraphs:
+        _append_paragraphs(tf, paragraphs)
 
     print(f"[SUCCESS] Added {title} to slide")
 
+def fetch_song(entry, song_order, file_index):
+    """Network + conversion only — no pptx mutation (python-pptx is not thread-safe)."""
+    name = song_order[entry['song_index']]
+    source = None
+
+    meta = file_index.get(f"{name}.docx".lower())
+    if meta:
+        local_file, data = download_file(meta["id"], name + ".docx", md5=meta.get("md5Checksum"))
+        source = data or local_file
+    else:
+        meta = file_index.get(f"{name}.doc".lower())
+        if meta:
+            # .doc stays path-based: the conversion fallback needs a file on disk
+            source, _ = download_file(meta["id"], name + ".doc", md5=meta.get("md5Checksum"))
+            # Pre-warm the conversion here so it overlaps with other downloads;
+            # extract_text_and_style will find the converted sibling already cached
+            if source and extract_doc_lines(source) is None and not os.path.exists(source + "x"):
+                convert_doc_to_docx(source)
+    return entry, name, source
+
 def generate_bulletin(song_order):
     prs = Presentation(CONFIG["TEMPLATE_PPTX"])
-    folder_id = find_file_id(CONFIG["LYRICS_FOLDER_NAME"])
+    folder_id = get_lyrics_folder_id()
     if not folder_id:
         print("[ERROR] Lyrics folder not found")
         return
 
-    SONG_SLIDE_MAP = [
-        {'slide_index': 3, 'side': 'left', 'song_index': 1},
-        {'slide_index': 3, 'side': 'right', 'song_index': 2},
-        {'slide_index': 2, 'side': 'left', 'song_index': 3},
-        {'slide_index': 1, 'side': 'right', 'song_index': 4},
-        {'slide_index': 2, 'side': 'right', 'song_index': 0},
-    ]
+    # song position in the entered order -> (slide_index, side)
+    SONG_PLACEMENT = {
+        1: (3, 'left'),
+        2: (3, 'right'),
+        3: (2, 'left'),
+        4: (1, 'right'),
+        0: (2, 'right'),
+    }
 
-    temp_files = []
-    for entry in SONG_SLIDE_MAP:
-        slide = prs.slides[entry['slide_index']]
-        side = entry['side']
-        idx = entry['song_index']
-        if idx >= len(song_order):
-            continue
-        name = song_order[idx]
+    # Fail fast on short song lists: report every unfillable placement up
+    # front so no Drive call is made on its behalf.
+    missing = {i for i in SONG_PLACEMENT if i >= len(song_order)}
+    for song_index in sorted(missing):
+        slide_index, side = SONG_PLACEMENT[song_index]
+        print(f"[WARN] No song at position {song_index + 1}; slide {slide_index + 1} ({side}) will keep its template content")
 
-        file_id = find_file_id(name + ".docx", parent_id=folder_id) or find_file_id(name + ".doc", parent_id=folder_id)
-        if not file_id:
-            print(f"[ERROR] File not found for {name}")
-            continue
+    entries = [
+        {'slide_index': placement[0], 'side': placement[1], 'song_index': song_index}
+        for song_index, placement in SONG_PLACEMENT.items()
+        if song_index not in missing
+    ]
 
-        ext = ".docx" if name + ".docx" in file_id else ".doc"
-        local_file = download_file(file_id, name + ext)
-        temp_files.append(local_file)
+    try:
+        file_index = list_folder_files(folder_id)
+    except HttpError as e:
+        if e.resp.status != 404:
+            raise
+        # The cached folder id went stale; re-resolve once and retry
+        folder_id = get_lyrics_folder_id(refresh=True)
+        if not folder_id:
+            print("[ERROR] Lyrics folder not found")
+            return
+        file_index = list_folder_files(folder_id)
 
-        if ext == ".doc":
-            docx_file = convert_doc_to_docx(local_file)
-            if docx_file:
-                temp_files.append(docx_file)
-                local_file = docx_file
+    results = []
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(fetch_song, entry, song_order, file_index) for entry in entries]
+        for future in as_completed(futures):
+            results.append(future.result())
 
-        lines = extract_text_and_style(local_file)
+    # All pptx mutation happens on the main thread
+    placements = []
+    for entry, name, source in results:
+        if source is None:
+            print(f"[ERROR] File not found for {name}")
+            continue
+        lines = extract_text_and_style(source)
         if lines:
-            print(f"[INSERT] {name} → Slide {entry['slide_index'] + 1} ({side})")
-            add_song_content(slide, side, name, lines)
+            placements.append((entry, name, lines))
+
+    # Clear each touched slide in a single shape-tree walk, then insert
+    sides_by_slide = {}
+    for entry, _, _ in placements:
+        sides_by_slide.setdefault(entry['slide_index'], set()).add(entry['side'])
+    for slide_index, sides in sides_by_slide.items():
+        partition_and_clear(prs.slides[slide_index], sides)
 
-    for f in temp_files:
-        if os.path.exists(f):
-            os.remove(f)
+    for entry, name, lines in placements:
+        print(f"[INSERT] {name} → Slide {entry['slide_index'] + 1} ({entry['side']})")
+        add_song_content(prs.slides[entry['slide_index']], entry['side'], name, lines)
 
     prs.save(CONFIG["OUTPUT_PPTX"])
     print(f"\n✅ Bulletin saved as '{CONFIG['OUTPUT_PPTX']}'")
@@ -1,15 +1,27 @@
+import functools
+import hashlib
+import io
+import json
 import os
 import re
 import subprocess
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from lxml import etree
+from xml.sax.saxutils import escape
 from pptx import Presentation
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import qn
+from pptx.shapes.autoshape import Shape
 from pptx.util import Pt, Inches
 from pptx.enum.text import PP_ALIGN
 from pptx.enum.text import MSO_ANCHOR
-from docx import Document
+from google.auth.transport.requests import AuthorizedSession
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
 
 # -------- CONFIG --------
 CONFIG = {
@@ -43,17 +55,71 @@ CONFIG = {
     }
 }
 
+# WordprocessingML namespace, pre-expanded for direct lxml traversal
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# Hot-loop patterns, compiled once at import (non-capturing: matches are discarded)
+_META_RE = re.compile(r'^(?:Hymnal #\d+|Verse \d+|Chorus)$', re.IGNORECASE)
+_PAREN_RE = re.compile(r'\s*\(.*?\)')
+# Cheap literals first; \b anchors reject mid-word digits/"by" without backtracking
+_FOOTER_RE = re.compile(r'©|CCLI|Public Domain|\b\d{4}\b|Words and Music|Translated|\bby \w+', re.IGNORECASE)
+
+# Layout constants, built once from CONFIG instead of allocated per line
+_FONT_PT = Pt(CONFIG["FONT_SIZE"])
+_TITLE_PT = Pt(CONFIG["TITLE_SIZE"])
+_FOOTNOTE_PT = Pt(CONFIG["FOOTNOTE_SIZE"])
+_DATE_PT = Pt(CONFIG["DATE_FONT_SIZE"])
+_MIDPOINT = Inches(5)
+_BOX_TOP = Inches(CONFIG["BOX_TOP"])
+_BOX_WIDTH = Inches(CONFIG["BOX_WIDTH"])
+_BOX_HEIGHT = Inches(CONFIG["BOX_HEIGHT"])
+_SIDE_LEFT = {'left': Inches(CONFIG["LEFT_MARGIN"]), 'right': Inches(CONFIG["RIGHT_MARGIN"])}
+
+# Run sizes in hundredths of a point, the unit <a:rPr sz=""> expects
+_BODY_SZ = CONFIG["FONT_SIZE"] * 100
+_FOOTNOTE_SZ = CONFIG["FOOTNOTE_SIZE"] * 100
+_A_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+
+def _run_xml(text, size_hundredths, italic=False, bold=False):
+    """Markup for a fully styled <a:r>; parsed in one go with its siblings.
+
+    Setting run.text plus three font properties walks python-pptx's
+    descriptor chain and mutates the XML four times per lyric line.
+    """
+    return (f'<a:r><a:rPr lang="en-US" sz="{size_hundredths}" b="{1 if bold else 0}" i="{1 if italic else 0}">'
+            f'<a:latin typeface="{CONFIG["FONT_NAME"]}"/></a:rPr>'
+            f'<a:t>{escape(text)}</a:t></a:r>')
+
+def _paragraph_xml(text, size_hundredths, italic=False, space_before=None):
+    """One left-aligned <a:p> holding a single styled run."""
+    spc = f'<a:spcBef><a:spcPts val="{space_before}"/></a:spcBef>' if space_before else ''
+    return f'<a:p><a:pPr algn="l">{spc}</a:pPr>{_run_xml(text, size_hundredths, italic=italic)}</a:p>'
+
+def _append_paragraphs(tf, paragraphs_xml):
+    """Parse all pending paragraphs once and splice them into the text frame."""
+    wrapper = parse_xml(f'<root xmlns:a="{_A_NS}">{"".join(paragraphs_xml)}</root>')
+    tf._txBody.extend(wrapper)
+
 # -------- GOOGLE SETUP --------
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
-creds = service_account.Credentials.from_service_account_file(CONFIG["SERVICE_ACCOUNT_FILE"], scopes=SCOPES)
-drive_service = build('drive', 'v3', credentials=creds)
+
+@functools.lru_cache(maxsize=1)
+def _get_creds():
+    return service_account.Credentials.from_service_account_file(
+        CONFIG["SERVICE_ACCOUNT_FILE"], scopes=SCOPES)
+
+@functools.lru_cache(maxsize=1)
+def get_drive():
+    # cache_discovery=False skips the deprecated file_cache probe that adds
+    # ~100ms (and a warning) to every build()
+    return build('drive', 'v3', credentials=_get_creds(), cache_discovery=False)
 
 # -------- HELPERS --------
 # def find_file_id(name, parent_id=None):
 #     query = f"name = '{name}'"
 #     if parent_id:
 #         query += f" and '{parent_id}' in parents"
-#     results = drive_service.files().list(q=query, fields="files(id, name)").execute()
+#     results = get_drive().files().list(q=query, fields="files(id, name)").execute()
 #     return results.get("files", [])[0]["id"] if results.get("files") else None
 
 def find_file_id(name, parent_id=None):
@@ -64,61 +130,134 @@ def find_file_id(name, parent_id=None):
         query += f" and '{parent_id}' in parents"
     try:
         print(f"[DEBUG] Querying Drive for: {safe_name}")
-        results = drive_service.files().list(q=query, fields="files(id, name)").execute()
+        results = get_drive().files().list(q=query, fields="files(id, name)").execute()
         files = results.get('files', [])
         return files[0]['id'] if files else None
     except Exception as e:
         print(f"[ERROR] Drive query failed for: {name} — {e}")
         return None
 
-def download_file(file_id, local_path):
-    request = drive_service.files().get_media(fileId=file_id)
-    with open(local_path, "wb") as f:
-        downloader = MediaIoBaseDownload(f, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-    return local_path
+def fetch_folder_index(folder_id):
+    """Build {file name: metadata} for the whole folder in one listing.
+
+    Replaces the two find_file_id round-trips per song (.docx then .doc)
+    with a single paged files.list call.
+    """
+    index = {}
+    page_token = None
+    while True:
+        results = get_drive().files().list(
+            q=f"'{folder_id}' in parents and trashed=false",
+            fields="nextPageToken, files(id, name, mimeType)",
+            pageSize=1000,
+            pageToken=page_token,
+        ).execute()
+        for f in results.get('files', []):
+            index[f['name']] = f
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return index
+
+# Sessions are not thread-safe; each download worker gets its own, and each
+# keeps its pooled keep-alive connection warm across that worker's downloads
+# (httplib2 under the discovery client opens a fresh connection per request).
+_thread_local = threading.local()
+
+def _session_for_thread():
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = AuthorizedSession(_get_creds())
+        _thread_local.session = session
+    return session
+
+GOOGLE_DOC_MIME = 'application/vnd.google-apps.document'
+DOCX_MIME = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+def download_file(file_id, mime_type=None):
+    # Lyric docs are well under 1MB, so one plain GET per file beats the
+    # MediaIoBaseDownload chunk loop; the bytes stay in memory because only
+    # the LibreOffice path ever needs a file on disk.
+    session = _session_for_thread()
+    if mime_type == GOOGLE_DOC_MIME:
+        # Google-native Docs have no raw bytes; export converts server-side
+        resp = session.get(f"https://www.googleapis.com/drive/v3/files/{file_id}/export",
+                           params={"mimeType": DOCX_MIME})
+    else:
+        resp = session.get(f"https://www.googleapis.com/drive/v3/files/{file_id}",
+                           params={"alt": "media"})
+    resp.raise_for_status()
+    return resp.content
 
-def convert_doc_to_docx(doc_path):
-    output_path = doc_path + "x"
+def start_doc_conversion(doc_path):
     soffice_path = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
     try:
-        subprocess.run([soffice_path, "--headless", "--convert-to", "docx", "--outdir", ".", doc_path],
-                       check=True, capture_output=True, text=True)
-        return output_path if os.path.exists(output_path) else None
+        # A unique profile dir lets multiple soffice instances run at once;
+        # they refuse to share one user installation.
+        profile = tempfile.mkdtemp(prefix="lo_bulletin_")
+        return subprocess.Popen(
+            [soffice_path, "--headless", f"-env:UserInstallation=file://{profile}",
+             "--convert-to", "docx", "--outdir", os.path.dirname(doc_path) or ".", doc_path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
     except Exception:
         return None
 
+def finish_doc_conversion(doc_path, proc):
+    output_path = doc_path + "x"
+    if proc is None:
+        return None
+    proc.wait()
+    return output_path if os.path.exists(output_path) else None
 
-def extract_text_and_style(docx_path):
+
+def extract_text_and_style(source):
     try:
-        doc = Document(docx_path)
+        # Read word/document.xml straight out of the zip (path or raw bytes)
+        # and walk it with lxml: no python-docx proxy objects.
+        with zipfile.ZipFile(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as z:
+            root = etree.fromstring(z.read('word/document.xml'))
         song_lines = []
 
-        for p_idx, p in enumerate(doc.paragraphs):
-            raw_para = p.text.strip()
-            if not raw_para:
+        for p in root.iter(_W + 'p'):
+            para_runs = []
+            for r in p.iter(_W + 'r'):
+                chunks = []
+                for el in r.iter():
+                    if el.tag == _W + 't':
+                        if el.text:
+                            chunks.append(el.text)
+                    elif el.tag in (_W + 'br', _W + 'cr'):
+                        chunks.append('\n')
+                run_text = ''.join(chunks)
+                if not run_text:
+                    continue
+                i_el = r.find(f'{_W}rPr/{_W}i')
+                is_italic = i_el is not None and i_el.get(_W + 'val') not in ('0', 'false')
+                # Word often fragments one visual line into many runs (spell
+                # check, formatting history); merge neighbours that share the
+                # italic state so each fragment no longer becomes its own line
+                if para_runs and para_runs[-1][1] == is_italic:
+                    para_runs[-1][0] += run_text
+                else:
+                    para_runs.append([run_text, is_italic])
+
+            # Strip each line exactly once here, rather than stripping the
+            # joined paragraph first and then every line again.
+            stripped = []
+            for run_text, is_italic in para_runs:
+                # Split multiline run content (w:br / w:cr within a run)
+                for line in run_text.splitlines():
+                    line = line.strip()
+                    if line:
+                        stripped.append((line, is_italic))
+            if not stripped:
                 song_lines.append(("", False))
                 continue
 
-            # Skip metadata like "Verse 1", "Chorus"
-            if re.match(r'^(Hymnal #\d+|Verse \d+|Chorus)$', raw_para.strip(), re.IGNORECASE):
+            # Skip metadata like "Verse 1", "Chorus" (always a lone line)
+            if len(stripped) == 1 and _META_RE.match(stripped[0][0]):
                 continue
 
-            for run_idx, run in enumerate(p.runs):
-                run_text = run.text.strip()
-                if not run_text:
-                    continue
-
-                is_italic = run.italic is True
-
-                # Split multiline run content
-                for i, line in enumerate(run_text.splitlines()):
-                    line = line.strip()
-                    if not line:
-                        continue
-                    song_lines.append((line, is_italic))
+            song_lines.extend(stripped)
 
         return song_lines
 
@@ -126,51 +265,80 @@ def extract_text_and_style(docx_path):
         print(f"[ERROR] extract_text_and_style failed: {e}")
         return []
 
+
+# Parsed-lyric cache: keyed by content hash, so a re-downloaded identical
+# file hits even if its name or mtime changed
+_PARSE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "bulletin")
+
+def extract_cached(source):
+    if isinstance(source, (bytes, bytearray)):
+        digest = hashlib.sha256(source).hexdigest()
+    else:
+        with open(source, 'rb') as f:
+            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+    cache_path = os.path.join(_PARSE_CACHE_DIR, digest + '.json')
+    try:
+        with open(cache_path) as f:
+            return [tuple(entry) for entry in json.load(f)]
+    except (OSError, ValueError):
+        pass
+    lines = extract_text_and_style(source)
+    if lines:
+        os.makedirs(_PARSE_CACHE_DIR, exist_ok=True)
+        with open(cache_path, 'w') as f:
+            json.dump(lines, f)
+    return lines
+
 def update_slide1_right(presentation):
     target_text_prefix = "Corporate Worship Service:"
-    upcoming_sunday = datetime.now()
-    while upcoming_sunday.weekday() != 6:
-        upcoming_sunday += timedelta(days=1)
-    date_str = upcoming_sunday.strftime("%B %-d, %Y") if hasattr(upcoming_sunday, 'strftime') else upcoming_sunday.strftime("%B %d, %Y")
+    today = datetime.now()
+    upcoming_sunday = today + timedelta(days=(6 - today.weekday()) % 7)
+    date_str = upcoming_sunday.strftime("%B %-d, %Y")
     new_text = f"{target_text_prefix} {date_str}"
 
     # Slide 0 = Slide 1 visually (Python-pptx is 0-indexed)
     slide = presentation.slides[0]
 
-    # Assume right half is shape index 1 or named something predictable
-    for shape in slide.shapes:
-        if shape.has_text_frame:
-            if any(paragraph.text.strip().startswith(target_text_prefix) for paragraph in shape.text_frame.paragraphs):
-                for para in shape.text_frame.paragraphs:
-                    if para.text.strip().startswith(target_text_prefix):
-                        para.text = new_text
-                        for run in para.runs:
-                            run.font.name = CONFIG["FONT_NAME"]
-                            run.font.size = Pt(CONFIG["DATE_FONT_SIZE"])
-                        break
+    # Write into the existing <a:t> node: para.text = ... rebuilds the
+    # paragraph, dropping the template's run formatting and forcing the
+    # font name/size to be reapplied by hand afterwards
+    nodes = slide.shapes._spTree.xpath(
+        f'.//a:t[starts-with(normalize-space(.), "{target_text_prefix}")]')
+    if nodes:
+        nodes[0].text = new_text
+    else:
+        print(f"[WARN] '{target_text_prefix}' text not found on slide 1")
 
 
 
+# Shape-tree children that carry a position; skips the group's own
+# nvGrpSpPr/grpSpPr bookkeeping elements
+_SHAPE_TAGS = (qn('p:sp'), qn('p:pic'), qn('p:graphicFrame'), qn('p:grpSp'), qn('p:cxnSp'))
+_OFFSET_XPATH = './p:spPr/a:xfrm/a:off/@x | ./p:grpSpPr/a:xfrm/a:off/@x | ./p:xfrm/a:off/@x'
+
 def clear_side(slide, side):
-    midpoint = Inches(5)
-    to_remove = []
-    for shape in slide.shapes:
-        if not hasattr(shape, "left"):
-            continue
-        if (side == 'left' and shape.left < midpoint) or (side == 'right' and shape.left >= midpoint):
-            to_remove.append(shape)
-    for shape in to_remove:
-        slide.shapes._spTree.remove(shape._element)
-    print(f"[CLEAR] Removed {len(to_remove)} shapes from slide ({side})")
+    # Read offsets straight from the XML; no python-pptx shape proxies
+    sp_tree = slide.shapes._spTree
+    want_left = side == 'left'
+    midpoint = int(_MIDPOINT)
+    keep = []
+    removed = 0
+    for el in sp_tree.iterchildren():
+        if el.tag in _SHAPE_TAGS:
+            off = el.xpath(_OFFSET_XPATH)
+            if off and (int(off[0]) < midpoint) == want_left:
+                removed += 1
+                continue
+        keep.append(el)
+    if removed:
+        # Rebuild the child list in one assignment; removing elements one at
+        # a time makes lxml re-index the remaining siblings per removal.
+        sp_tree[:] = keep
+    print(f"[CLEAR] Removed {removed} shapes from slide ({side})")
 
 def add_song_content(slide, side, title, lines, slide_index):
-    top = Inches(CONFIG["BOX_TOP"])
-    width = Inches(CONFIG["BOX_WIDTH"])
-    height = Inches(CONFIG["BOX_HEIGHT"])
-    left = Inches(CONFIG["LEFT_MARGIN"] if side == 'left' else CONFIG["RIGHT_MARGIN"])
-
     clear_side(slide, side)
-    box = slide.shapes.add_textbox(left, top, width, height)
+    box = slide.shapes.add_textbox(_SIDE_LEFT[side], _BOX_TOP, _BOX_WIDTH, _BOX_HEIGHT)
     tf = box.text_frame
     tf.clear()
     tf.word_wrap = True
@@ -186,19 +354,19 @@ def add_song_content(slide, side, title, lines, slide_index):
     run_title = p_title.add_run()
     run_title.text = title
     run_title.font.name = CONFIG["FONT_NAME"]
-    run_title.font.size = Pt(CONFIG["TITLE_SIZE"])
+    run_title.font.size = _TITLE_PT
     run_title.font.bold = True
 
     slide_number = CONFIG["PAGE_NUMBERS"].get((slide_index, side), None)
     if slide_number is not None:
         run_tab = p_title.add_run()
         run_tab.text = "    "
-        run_tab.font.size = Pt(CONFIG["TITLE_SIZE"])
+        run_tab.font.size = _TITLE_PT
         run_tab.font.name = CONFIG["FONT_NAME"]
 
         run_page = p_title.add_run()
         run_page.text = str(slide_number)
-        run_page.font.size = Pt(CONFIG["TITLE_SIZE"])
+        run_page.font.size = _TITLE_PT
         run_page.font.name = CONFIG["FONT_NAME"]
 
     # Remove duplicate title line from lyrics
@@ -211,76 +379,67 @@ def add_song_content(slide, side, title, lines, slide_index):
         if not text:
             lines.pop()
             continue
-        if re.search(r'(©|CCLI|Public Domain|Words and Music|[0-9]{4}|Translated|by\s+\w+)', text, re.IGNORECASE):
+        if _FOOTER_RE.search(text):
             footer_lines.insert(0, lines.pop())
         else:
             break
 
-    # Main song body
+    # Main song body, collected as markup and parsed in a single pass:
+    # tf.add_paragraph() per line makes lxml re-index a growing txBody
+    paragraphs = []
     prev_italic = None  # Track the previous line's italic state
 
     for (text, is_italic) in lines:
         if not text.strip():
-            tf.add_paragraph()
+            paragraphs.append('<a:p/>')
             continue
 
         # Add spacing when switching from italic to non-italic (e.g. chorus → verse)
         if prev_italic is True and is_italic is False:
-            tf.add_paragraph()  # Insert line gap
+            paragraphs.append('<a:p/>')  # Insert line gap
             print("[SPACING] Inserted blank line between italic and non-italic blocks")
 
         if '\n' in text:
             for subline in text.splitlines():
                 if not subline.strip():
-                    tf.add_paragraph()
-                    continue
-                p = tf.add_paragraph()
-                p.alignment = PP_ALIGN.LEFT
-                run = p.add_run()
-                run.text = subline
-                run.font.size = Pt(CONFIG["FONT_SIZE"])
-                run.font.name = CONFIG["FONT_NAME"]
-                run.font.italic = is_italic
+                    paragraphs.append('<a:p/>')
+                else:
+                    paragraphs.append(_paragraph_xml(subline, _BODY_SZ, italic=is_italic))
         else:
-            p = tf.add_paragraph()
-            p.alignment = PP_ALIGN.LEFT
-            run = p.add_run()
-            run.text = text
-            run.font.size = Pt(CONFIG["FONT_SIZE"])
-            run.font.name = CONFIG["FONT_NAME"]
-            run.font.italic = is_italic
+            paragraphs.append(_paragraph_xml(text, _BODY_SZ, italic=is_italic))
 
         prev_italic = is_italic  # Update tracker
 
-    # Footer lines (smaller font)
+    # Footer lines (smaller font, 6pt space above)
     for (text, is_italic) in footer_lines:
-        p_ref = tf.add_paragraph()
-        p_ref.alignment = PP_ALIGN.LEFT
-        p_ref.space_before = Pt(6)
-        run_ref = p_ref.add_run()
-        run_ref.text = text
-        run_ref.font.size = Pt(CONFIG["FOOTNOTE_SIZE"])
-        run_ref.font.name = CONFIG["FONT_NAME"]
-        run_ref.font.italic = is_italic
+        paragraphs.append(_paragraph_xml(text, _FOOTNOTE_SZ, italic=is_italic, space_before=600))
+
+    if paragraphs:
+        _append_paragraphs(tf, paragraphs)
 
     print(f"[SUCCESS] Added {title} ({slide_number}) to slide")
 
 def update_order_of_service(prs, song_titles):
     slide = prs.slides[1]  # Slide 2 visually
-    left_margin_limit = Inches(5)
     hymn_index = 0
+    midpoint = int(_MIDPOINT)
 
-    for shape in slide.shapes:
-        if not shape.has_text_frame or shape.left >= left_margin_limit:
+    # XPath pre-filter at the XML level: only wrap a shape proxy around the
+    # rare <p:sp> that actually contains a HYMN line on the left half
+    for sp in slide.shapes._spTree.iterchildren(qn('p:sp')):
+        if not sp.xpath('.//a:t[starts-with(normalize-space(.), "HYMN")]'):
+            continue
+        off = sp.xpath('./p:spPr/a:xfrm/a:off/@x')
+        if off and int(off[0]) >= midpoint:
             continue
 
-        tf = shape.text_frame
+        tf = Shape(sp, None).text_frame
         for para in tf.paragraphs:
             text = para.text.strip()
             if text.startswith("HYMN") and hymn_index < len(song_titles):
                 raw_title = song_titles[hymn_index]
                 # Remove any text in brackets for layout safety
-                clean_title = re.sub(r'\s*\(.*?\)', '', raw_title).strip()
+                clean_title = _PAREN_RE.sub('', raw_title).strip()
                 quoted_title = f'“{clean_title}”'
 
                 # Estimate padding (adjust total_width if needed)
@@ -293,13 +452,13 @@ def update_order_of_service(prs, song_titles):
                 run_hymn = para.add_run()
                 run_hymn.text = "HYMN" + " " * padding
                 run_hymn.font.name = CONFIG["FONT_NAME"]
-                run_hymn.font.size = Pt(CONFIG["FONT_SIZE"])
+                run_hymn.font.size = _FONT_PT
                 run_hymn.font.bold = True
 
                 run_title = para.add_run()
                 run_title.text = quoted_title
                 run_title.font.name = CONFIG["FONT_NAME"]
-                run_title.font.size = Pt(CONFIG["FONT_SIZE"])
+                run_title.font.size = _FONT_PT
                 run_title.font.bold = False
 
     print(f"[COMPLETE] Inserted {hymn_index} HYMN titles into Order of Service.\n")
@@ -322,38 +481,69 @@ def generate_bulletin(song_order):
         {'slide_index': 2, 'side': 'right', 'song_index': 0},
     ]
 
-    temp_files = []
+    folder_index = fetch_folder_index(folder_id)
+
+    # One download, conversion, and parse per unique song, even when several
+    # slides share the same song_index
+    songs = {}
     for entry in SONG_SLIDE_MAP:
-        slide = prs.slides[entry['slide_index']]
-        side = entry['side']
         idx = entry['song_index']
-        if idx >= len(song_order):
+        if idx >= len(song_order) or idx in songs:
             continue
         name = song_order[idx]
 
-        file_id = find_file_id(name + ".docx", parent_id=folder_id) or find_file_id(name + ".doc", parent_id=folder_id)
-        if not file_id:
+        ext = ".docx" if name + ".docx" in folder_index else ".doc"
+        meta = folder_index.get(name + ext)
+        if not meta:
             print(f"[ERROR] File not found for {name}")
             continue
+        if meta.get('mimeType') == GOOGLE_DOC_MIME:
+            # Exported bytes are already docx regardless of the Drive name,
+            # so no LibreOffice round-trip is needed
+            ext = ".docx"
+        songs[idx] = (name, ext, meta)
+
+    # The downloads are independent and network-bound, so overlap them;
+    # everything that touches the presentation stays on the main thread.
+    with ThreadPoolExecutor(max_workers=5) as ex:
+        payloads = dict(zip(songs, ex.map(
+            lambda s: download_file(s[2]['id'], s[2].get('mimeType')), songs.values())))
+
+    # Only legacy .doc files touch the disk: LibreOffice converts a file,
+    # not a byte stream. The scratch dir cleans itself up, replacing the
+    # temp_files list and its stat+unlink loop, and keeps conversion
+    # artifacts out of the working directory. Every conversion is kicked
+    # off at once; each soffice run costs seconds and they overlap cleanly.
+    parsed = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        conversions = {}
+        for idx, (name, ext, meta) in songs.items():
+            if ext == ".doc":
+                doc_path = os.path.join(scratch, name + ext)
+                with open(doc_path, "wb") as f:
+                    f.write(payloads[idx])
+                conversions[idx] = (doc_path, start_doc_conversion(doc_path))
+
+        for idx, (name, ext, meta) in songs.items():
+            if ext == ".doc":
+                doc_path, proc = conversions[idx]
+                docx_file = finish_doc_conversion(doc_path, proc)
+                parsed[idx] = extract_cached(docx_file) if docx_file else []
+            else:
+                parsed[idx] = extract_cached(payloads[idx])
 
-        ext = ".docx" if name + ".docx" in file_id else ".doc"
-        local_file = download_file(file_id, name + ext)
-        temp_files.append(local_file)
-
-        if ext == ".doc":
-            docx_file = convert_doc_to_docx(local_file)
-            if docx_file:
-                temp_files.append(docx_file)
-                local_file = docx_file
-
-        lines = extract_text_and_style(local_file)
+    for entry in SONG_SLIDE_MAP:
+        idx = entry['song_index']
+        lines = parsed.get(idx)
         if lines:
+            slide = prs.slides[entry['slide_index']]
+            side = entry['side']
+            name = song_order[idx]
             print(f"[INSERT] {name} → Slide {entry['slide_index'] + 1} ({side})")
-            add_song_content(slide, side, name, lines, entry['slide_index'])
+            # add_song_content trims the title and pops footer lines in
+            # place, so each slide gets its own copy
+            add_song_content(slide, side, name, list(lines), entry['slide_index'])
 
-    for f in temp_files:
-        if os.path.exists(f):
-            os.remove(f)
 
     prs.save(CONFIG["OUTPUT_PPTX"])
     print(f"\n✅ Bulletin saved as '{CONFIG['OUTPUT_PPTX']}'")